@@ -3,16 +3,27 @@ import tkinter.ttk as ttk
 from tkinter import filedialog, messagebox
 import pandas as pd
 import pytesseract
-from pdf2image import convert_from_path
-from PIL import Image, ImageFilter, ImageOps
-from collections import defaultdict
+from PIL import Image
+from collections import Counter
+import concurrent.futures
+import cv2
 import fitz
+import numpy as np
 import logging
 import re
 import sys
 import os
+import threading
 
-# POPPLER_PATH = "YOUR PATH GOES HERE" # poppler path goes here in case the other one does not work.
+try:
+    import hyperscan
+except ImportError:  # optional accelerator; the re path below is the fallback
+    hyperscan = None
+
+try:
+    from tesserocr import PyTessBaseAPI, PSM, OEM
+except ImportError:  # optional; pytesseract subprocess path is the fallback
+    PyTessBaseAPI = None
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
@@ -27,7 +38,6 @@ def resource_path(relative_path):
 
 # Replace your existing path definitions with these:
 TESSERACT_PATH = resource_path(os.path.join('tesseract', 'tesseract.exe'))
-POPPLER_PATH = resource_path(os.path.join('poppler', 'bin'))
 
 pytesseract.pytesseract.tesseract_cmd = TESSERACT_PATH
 
@@ -36,196 +46,315 @@ Image.MAX_IMAGE_PIXELS = None
 # New pattern for circle codes: 1-5 alphanumeric characters, case insensitive
 CIRCLE_CODE_PATTERN = r'\b([A-Za-z0-9]{1,5})\b'
 
-def preprocess_image(img):
-    """Enhanced image preprocessing for better OCR accuracy"""
-    try:
-        # Convert to grayscale
-        img = img.convert('L')
+# Precompiled patterns: the extraction functions run once per page (and the
+# cleaners once per match) on large documents, so compile everything a single
+# time at import instead of on every call.
+
+# Material code pattern (with length or with spacing)
+_RE_MATERIAL = re.compile(
+    r"""
+    (\d+Rfi(?:\d+(?:/\d+)*)?(?:cm)?[,]?L=\d+\.?\d*m['']?)  # Format 1
+    |                                                       # OR
+    (\d+Rfi\d+/\d+cm)                                      # Format 2
+    """,
+    re.VERBOSE | re.IGNORECASE
+)
+
+# Strict circle code pattern: e.g., T1, T10, R14, B1, UT9, UT7a, or just numbers (1, 10, 14, etc.)
+_RE_STRICT_CIRCLE = re.compile(r"([A-Z]{1,2}\d{1,2}[a-z]?|\d{1,3})")
+
+# Both material formats start with '<digits>Rfi', so this is a necessary
+# condition for any match -- a safe prefilter that can never skip a real hit
+_HS_MATERIAL_PREFILTER = rb"\d+Rfi"
+_RE_MATERIAL_PREFILTER = re.compile(r"\d+Rfi", re.IGNORECASE)
+_hs_material_db = None
+
+
+def _page_has_material(text):
+    """Cheap containment test for material codes before the full Python-level scan.
+
+    Uses Hyperscan's block-mode DFA when the optional dependency is installed,
+    otherwise a plain re search. Most pages of a large drawing set contain no
+    material codes at all, so this skips the expensive association pass."""
+    if hyperscan is None:
+        return _RE_MATERIAL_PREFILTER.search(text) is not None
+    global _hs_material_db
+    if _hs_material_db is None:
+        db = hyperscan.Database(mode=hyperscan.HS_MODE_BLOCK)
+        db.compile(expressions=[_HS_MATERIAL_PREFILTER], ids=[1],
+                   flags=[hyperscan.HS_FLAG_CASELESS | hyperscan.HS_FLAG_SINGLEMATCH])
+        _hs_material_db = db
+    found = []
+
+    def on_match(pat_id, start, end, flags, context=None):
+        found.append(pat_id)
+        return 1  # first hit is enough; stop scanning
 
-        # Auto-contrast to enhance text visibility
-        img = ImageOps.autocontrast(img)
+    try:
+        _hs_material_db.scan(text.encode('utf-8', 'replace'), match_event_handler=on_match)
+    except hyperscan.error as e:
+        # Termination after the first match surfaces as an error too; only a
+        # failure with no match recorded is a real one, and skipping the page
+        # on it would silently drop results -- fall back to the re prefilter
+        if not found:
+            logging.warning(f"Hyperscan scan failed: {str(e)}")
+            return _RE_MATERIAL_PREFILTER.search(text) is not None
+    return bool(found)
+
+# Character-level fixes as translate tables: a single C pass per string,
+# cheaper than a regex character class
+_NOISE_CHARS_TABLE = str.maketrans('', '', '|!"\';~_')
+_NORMALIZE_TABLE = str.maketrans({'’': "'", '\r': None})
+
+_RE_WHITESPACE = re.compile(r"\s+")
+_RE_HYPHEN_BREAK = re.compile(r'(\d+Rfi[^\n]*)-\s*\n\s*(\d)')
+
+# Space normalization around the key elements of a material code
+_RE_L_EQ = re.compile(r"\s*,\s*L\s*=\s*")
+_RE_SLASH = re.compile(r"\s*/\s*")
+_RE_CM = re.compile(r"\s*cm\s*")
+
+# Same four normalizations fused into one alternation so each matched material
+# code is scanned once instead of four times
+_RE_CLEAN_MATERIAL = re.compile(r"\s*,\s*L\s*=\s*|\s*/\s*|\s*cm\s*|\s*Rfi\s*")
+
+# Common OCR errors in material codes, fixed in a single fused scan with a
+# dict-lookup callback instead of one str.replace pass per key
+_OCR_REPLACEMENTS = {
+    "ﬁ": "fi",
+    "ﬂ": "fl",
+    "..": ".",
+    "cm": "cm",
+    "em": "cm",
+    "m'": "m",
+    "m\"": "m",
+    "L = ": "L=",
+    "L =": "L=",
+    "L= ": "L=",
+    " ,": ",",
+    " '": "'"
+}
+_RE_OCR_FIXES = re.compile(
+    "|".join(re.escape(k) for k in sorted(_OCR_REPLACEMENTS, key=len, reverse=True))
+)
+
+# Tesseract accuracy peaks around 30px line height; scaling to that target
+# instead of blindly doubling keeps the pixel count (and OCR time) down
+_TARGET_LINE_HEIGHT = 32
+
+# Ink bands thinner than this are drawing strokes and hatching, not text
+# lines; counting them would collapse the median to the stroke width
+_MIN_TEXT_BAND = 10
+
+
+def _estimate_line_height(arr):
+    """Median text line height in pixels, from the horizontal ink projection"""
+    ink_rows = (arr < 128).sum(axis=1) > max(1, arr.shape[1] // 200)
+    edges = np.flatnonzero(np.diff(np.concatenate(([0], ink_rows.astype(np.int8), [0]))))
+    heights = edges.reshape(-1, 2)
+    heights = heights[:, 1] - heights[:, 0]
+    heights = heights[heights >= _MIN_TEXT_BAND]
+    if len(heights) < 3:
+        return None
+    return float(np.median(heights))
 
-        # Adaptive binarization (with a lower threshold to catch faint text)
-        threshold = 150
-        img = img.point(lambda x: 0 if x < threshold else 255, '1')
 
-        # Resize to double dimensions to help OCR with small fonts
-        img = img.resize((img.width * 2, img.height * 2), Image.LANCZOS)
+def preprocess_image(img):
+    """Enhanced image preprocessing for better OCR accuracy"""
+    try:
+        # Grayscale + contrast-limited equalization to enhance text visibility
+        arr = np.asarray(img.convert('L'))
+        arr = cv2.createCLAHE(clipLimit=2.0).apply(arr)
+
+        # Adaptive binarization (handles faint text and uneven lighting)
+        arr = cv2.adaptiveThreshold(arr, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
+                                    cv2.THRESH_BINARY, 31, 10)
+
+        # Bring the median line height to tesseract's sweet spot; when the
+        # projection finds no usable lines, normalize the page height instead
+        line_height = _estimate_line_height(arr)
+        if line_height:
+            scale = _TARGET_LINE_HEIGHT / line_height
+        else:
+            scale = 1500.0 / arr.shape[0]
+        # Cap the upscale at the old fixed doubling so the pixel count (and
+        # tesseract work) can never exceed the previous behavior
+        scale = min(max(scale, 0.25), 2.0)
+        if abs(scale - 1.0) > 0.05:
+            arr = cv2.resize(arr, None, fx=scale, fy=scale,
+                             interpolation=cv2.INTER_CUBIC)
 
         # Sharpen text edges
-        img = img.filter(ImageFilter.SHARPEN)
-        img = img.filter(ImageFilter.EDGE_ENHANCE_MORE)
+        kernel = np.array([[0, -1, 0], [-1, 5, -1], [0, -1, 0]])
+        arr = cv2.filter2D(arr, -1, kernel)
 
-        return img
+        return Image.fromarray(arr)
     except Exception as e:
         logging.error(f"Image preprocessing failed: {str(e)}")
         return img
 
 
+def _render_page(page, dpi=300):
+    """Rasterize a page to a PIL image in-process (no poppler subprocess or temp files)"""
+    mat = fitz.Matrix(dpi / 72, dpi / 72)
+    pm = page.get_pixmap(matrix=mat, alpha=False)
+    return Image.frombytes("RGB", (pm.width, pm.height), pm.samples)
+
+
+# Per-process tesserocr engine: loading the language model costs ~200ms, so
+# each OCR worker initializes it once and reuses it for every page it handles
+_tess_api = None
+
+
+def _image_to_string(img):
+    """OCR one image, via the persistent tesserocr engine when available"""
+    if PyTessBaseAPI is None:
+        return pytesseract.image_to_string(img, config='--oem 3 --psm 6')
+    global _tess_api
+    if _tess_api is None:
+        _tess_api = PyTessBaseAPI(psm=PSM.SINGLE_BLOCK, oem=OEM.DEFAULT)
+    _tess_api.SetImage(img)
+    return _tess_api.GetUTF8Text()
+
+
+def _ocr_page(pdf_path, page_num, dpi=300):
+    """OCR a single PDF page. Top-level so it can be pickled into worker processes."""
+    with fitz.open(pdf_path) as doc:
+        page_img = _render_page(doc.load_page(page_num - 1), dpi=dpi)
+    page_img = preprocess_image(page_img)
+    return page_num, _image_to_string(page_img)
+
+
+def _ocr_pages(pdf_path, dpi=300, page_nums=None):
+    """Run OCR over the given pages in parallel, returning (page_num, text) pairs in page order"""
+    if page_nums is None:
+        with fitz.open(pdf_path) as doc:
+            page_nums = range(1, doc.page_count + 1)
+    with concurrent.futures.ProcessPoolExecutor(max_workers=os.cpu_count()) as pool:
+        futures = [pool.submit(_ocr_page, pdf_path, n, dpi) for n in page_nums]
+        pages = [f.result() for f in futures]
+    pages.sort(key=lambda item: item[0])
+    return pages
+
+
+def _clean_material(material_code):
+    """Collapse spacing around ',L=', '/', 'cm' and 'Rfi' in a single pass"""
+    clean = _RE_CLEAN_MATERIAL.sub(lambda m: "".join(m.group(0).split()), material_code)
+    return clean.rstrip("'")
+
+
 def clean_ocr_text(text):
     """Clean OCR output text while preserving essential format"""
     # Standardize common OCR errors in material codes
-    replacements = {
-        "ﬁ": "fi",
-        "ﬂ": "fl",
-        "..": ".",
-        "cm": "cm",
-        "em": "cm",
-        "m'": "m",
-        "m\"": "m",
-        "L =": "L=",
-        "L= ": "L=",
-        " ,": ",",
-        " '": "'"
-    }
-    for wrong, right in replacements.items():
-        text = text.replace(wrong, right)
+    text = _RE_OCR_FIXES.sub(lambda m: _OCR_REPLACEMENTS[m.group(0)], text)
     # Remove problematic characters but keep needed punctuation
-    text = re.sub(r"[|!\"';~_]", "", text)
-    text = re.sub(r"\s+", " ", text).strip()
+    text = text.translate(_NOISE_CHARS_TABLE)
+    text = _RE_WHITESPACE.sub(" ", text).strip()
     return text
 
 def preprocess_text(text):
     """Handle line breaks and hyphenation in material codes"""
     # Replace line breaks with space when they occur within material codes
-    text = re.sub(r'(\d+Rfi[^\n]*)-\s*\n\s*(\d)', r'\1\2', text)
+    text = _RE_HYPHEN_BREAK.sub(r'\1\2', text)
     # Standardize spaces around key elements
-    text = re.sub(r'\s*,\s*L\s*=\s*', ',L=', text)
-    text = re.sub(r'\s*/\s*', '/', text)
-    text = re.sub(r'\s*cm\s*', 'cm', text)
+    text = _RE_L_EQ.sub(',L=', text)
+    text = _RE_SLASH.sub('/', text)
+    text = _RE_CM.sub('cm', text)
     return text
 
 def extract_materials(pdf_path, target_circle_codes):
     """Extracts materials from PDF (native + OCR) with duplicates"""
     results = []
-    counts = defaultdict(int)
+    counts = Counter()
 
-    # Try native PDF extraction first
+    # Decide per page between native text and OCR, so one scanned insert in an
+    # otherwise typed document still gets OCR'd (and typed pages never do)
+    ocr_page_nums = []
     try:
-        doc = fitz.open(pdf_path)
-        for page_num in range(len(doc)):
-            page = doc.load_page(page_num)
-            text = page.get_text()
-            page_results, page_counts = extract_all_codes(text, target_circle_codes, str(page_num + 1))
-            results.extend(page_results)
-            for code, count in page_counts.items():
-                counts[code] += count
+        with fitz.open(pdf_path) as doc:
+            for page_num in range(len(doc)):
+                page = doc.load_page(page_num)
+                text = page.get_text()
+                # Trust the text layer when the page has real text and either a
+                # material hit or no embedded images; otherwise OCR the page
+                if len(text) > 50 and (_RE_MATERIAL.search(text) or not page.get_images()):
+                    page_results, page_counts = extract_all_codes(text, target_circle_codes, str(page_num + 1))
+                    results.extend(page_results)
+                    counts.update(page_counts)
+                else:
+                    ocr_page_nums.append(page_num + 1)
     except Exception as e:
         logging.warning(f"Native PDF extraction failed: {str(e)}")
+        # Discard partial native output before OCR'ing every page, otherwise
+        # pages processed before the failure would be reported twice
+        results = []
+        counts = Counter()
+        ocr_page_nums = None  # document-level failure: OCR every page
 
-    # Fallback to OCR if no results
-    if not results:
-        pages = convert_from_path(pdf_path, dpi=300, poppler_path=POPPLER_PATH)
-        for page_num, page_img in enumerate(pages, 1):
-            text = pytesseract.image_to_string(page_img, config='--oem 3 --psm 6')
+    if ocr_page_nums is None or ocr_page_nums:
+        for page_num, text in _ocr_pages(pdf_path, dpi=300, page_nums=ocr_page_nums):
             page_results, page_counts = extract_all_codes(text, target_circle_codes, str(page_num))
             results.extend(page_results)
-            for code, count in page_counts.items():
-                counts[code] += count
+            counts.update(page_counts)
+        results.sort(key=lambda item: int(item["Page"]))
 
     return results, counts
 
 def extract_all_codes(text, target_circle_codes, current_page="N/A"):
     results = []
-    counts = defaultdict(int)
-    text = re.sub(r"[’']", "'", text)
-    text = re.sub(r"\r", "", text)
-    lines = text.split("\n")
-
-    # Material code pattern (with length or with spacing)
-    material_pattern = re.compile(
-        r"""
-        (\d+Rfi(?:\d+(?:/\d+)*)?(?:cm)?[,]?L=\d+\.?\d*m['']?)  # Format 1
-        |                                                       # OR
-        (\d+Rfi\d+/\d+cm)                                      # Format 2
-        """,
-        re.VERBOSE | re.IGNORECASE
-    )
-
-    # Strict circle code pattern: e.g., T1, T10, R14, B1, UT9, UT7a, or just numbers (1, 10, 14, etc.)
-    strict_circle_pattern = re.compile(r"([A-Z]{1,2}\d{1,2}[a-z]?|\d{1,3})")
-
-    i = 0
-    while i < len(lines):
-        line = lines[i].strip()
-        if not line:
-            i += 1
-            continue
-        mat_match = material_pattern.search(line)
-        if mat_match:
-            material_code = mat_match.group(1) or mat_match.group(2)
-            clean_material = re.sub(r"\s*,\s*L\s*=\s*", ",L=", material_code)
-            clean_material = re.sub(r"\s*/\s*", "/", clean_material)
-            clean_material = re.sub(r"\s*cm\s*", "cm", clean_material)
-            clean_material = re.sub(r"\s*Rfi\s*", "Rfi", clean_material)
-            clean_material = clean_material.rstrip("'")
-            # Look for a circle code to the right of the material code
-            right_text = line[mat_match.end():]
-            code_match = strict_circle_pattern.search(right_text)
-            if code_match:
-                circle_code = code_match.group(1)
+    counts = Counter()
+    text = text.translate(_NORMALIZE_TABLE)
+    if not _page_has_material(text):
+        return results, counts
+
+    # One C-level scan over the whole page text instead of a regex search per
+    # line; line boundaries are recovered from the match offsets as needed
+    for mat_match in _RE_MATERIAL.finditer(text):
+        material_code = mat_match.group(1) or mat_match.group(2)
+        clean_material = _clean_material(material_code)
+        # Look for a circle code to the right of the material code
+        line_end = text.find("\n", mat_match.end())
+        if line_end == -1:
+            line_end = len(text)
+        right_text = text[mat_match.end():line_end]
+        code_match = _RE_STRICT_CIRCLE.search(right_text)
+        if code_match:
+            circle_code = code_match.group(1)
+            results.append({
+                "Circle Code": circle_code,
+                "Material Code": clean_material,
+                "Page": current_page
+            })
+        else:
+            # Look at the next non-empty line for a circle code
+            found_code = None
+            pos = line_end
+            while pos < len(text):
+                next_end = text.find("\n", pos + 1)
+                if next_end == -1:
+                    next_end = len(text)
+                next_line = text[pos + 1:next_end].strip()
+                if next_line:
+                    code_match_next = _RE_STRICT_CIRCLE.fullmatch(next_line)
+                    if code_match_next:
+                        found_code = code_match_next.group(1)
+                    break
+                pos = next_end
+            if found_code:
                 results.append({
-                    "Circle Code": circle_code,
+                    "Circle Code": found_code,
                     "Material Code": clean_material,
                     "Page": current_page
                 })
-                counts[circle_code] += 1
             else:
-                # Look at the next non-empty line for a circle code
-                j = i + 1
-                found_code = None
-                while j < len(lines):
-                    next_line = lines[j].strip()
-                    if next_line:
-                        code_match_next = strict_circle_pattern.fullmatch(next_line)
-                        if code_match_next:
-                            found_code = code_match_next.group(1)
-                        break
-                    j += 1
-                if found_code:
-                    results.append({
-                        "Circle Code": found_code,
-                        "Material Code": clean_material,
-                        "Page": current_page
-                    })
-                    counts[found_code] += 1
-                else:
-                    results.append({
-                        "Circle Code": "",
-                        "Material Code": clean_material,
-                        "Page": current_page
-                    })
-        i += 1
+                results.append({
+                    "Circle Code": "",
+                    "Material Code": clean_material,
+                    "Page": current_page
+                })
+    counts.update(item["Circle Code"] for item in results if item["Circle Code"])
     return results, counts
 
-def clean_material_code(material_code):
-    """More flexible cleaning of material codes"""
-    clean = re.sub(r"\s+", "", material_code)
-    clean = re.sub(r"(?i)rfi?", "Rfi", clean)
-    clean = re.sub(r",\s*L\s*=", ",L=", clean)
-    clean = re.sub(r"([.,])(\d*m)", r".\2", clean)
-
-    # Handle cases where cm might be missing
-    if "cm" not in clean.lower():
-        clean = re.sub(r"(?i)(\d+rfi\d+(?:/\d+)*),", r"\1cm,", clean)
-
-    return clean if validate_material_code(clean) else None
-
-
-def validate_material_code(material_code):
-    """Validates material code format"""
-    # More flexible pattern to handle variations
-    pattern = r"""
-        ^\d+              # Number at start
-        Rfi              # Rfi
-        \d+              # Number
-        /\d+cm           # /number cm
-        ,L=\d+\.?\d*m$   # ,L=number.m
-    """
-    return bool(re.match(pattern, material_code, re.VERBOSE | re.IGNORECASE))
-
-
-
 def save_to_excel(data, save_path):
     """Save results to Excel with proper formatting"""
     try:
@@ -253,139 +382,168 @@ def browse_pdf():
 
 def extract_all_materials(text):
     """Extract all material codes, regardless of circle code association"""
-    # Pattern for both types: with length and with spacing
-    material_pattern = re.compile(
-        r"""
-        (\d+Rfi(?:\d+(?:/\d+)*)?(?:cm)?[,]?L=\d+\.?\d*m['']?)  # Format 1
-        |                                                       # OR
-        (\d+Rfi\d+/\d+cm)                                      # Format 2
-        """,
-        re.VERBOSE | re.IGNORECASE
-    )
     materials = set()
-    for m in material_pattern.finditer(text):
+    for m in _RE_MATERIAL.finditer(text):
         code = m.group(1) or m.group(2)
         if code:
-            clean_material = re.sub(r"\s*,\s*L\s*=\s*", ",L=", code)
-            clean_material = re.sub(r"\s*/\s*", "/", clean_material)
-            clean_material = re.sub(r"\s*cm\s*", "cm", clean_material)
-            clean_material = re.sub(r"\s*Rfi\s*", "Rfi", clean_material)
-            clean_material = clean_material.rstrip("'")
-            materials.add(clean_material)
+            materials.add(_clean_material(code))
     return list(materials)
 
+# Buttons disabled while a background job runs; filled in at GUI setup
+_process_buttons = []
+
+
+def _set_buttons_state(state):
+    for btn in _process_buttons:
+        btn.config(state=state)
+
+
+def _run_in_background(worker, on_done):
+    """Run worker() off the Tk main thread and hand its result to on_done.
+
+    Keeps the window responsive during multi-minute extractions. Tk is not
+    thread-safe, so the worker must not touch widgets; on_done runs on the
+    main thread via root.after."""
+    _set_buttons_state(tk.DISABLED)
+
+    def _target():
+        try:
+            result = worker()
+            error = None
+        except Exception as e:
+            logging.error(f"Processing error: {str(e)}")
+            result, error = None, e
+
+        def _finish():
+            _set_buttons_state(tk.NORMAL)
+            if error is not None:
+                messagebox.showerror("Error", f"An error occurred: {str(error)}")
+            else:
+                on_done(result)
+
+        root.after(0, _finish)
+
+    threading.Thread(target=_target, daemon=True).start()
+
+
 def process_pdf():
     """Main processing function with improved error handling and dual material counting """
     pdf_path = pdf_entry.get()
     circle_codes_input = circle_entry.get().strip()
-    
+
     if not pdf_path:
         messagebox.showerror("Error", "Please provide a PDF path!")
         return
-        
+
     if not circle_codes_input:
         messagebox.showerror("Error", "Please enter at least one circle code!")
         return
 
-    try:
-        # Process circle codes
-        circle_codes = [code.strip() for code in circle_codes_input.split(",") if code.strip()]
-        circle_codes_upper = [code.upper() for code in circle_codes]
-        
-        if not circle_codes:
-            messagebox.showerror("Error", "Please enter valid circle codes!")
-            return
+    # Process circle codes
+    circle_codes = [code.strip() for code in circle_codes_input.split(",") if code.strip()]
+    circle_codes_upper = [code.upper() for code in circle_codes]
 
-        # First extract all materials from the PDF (all pages)
-        doc = fitz.open(pdf_path)
-        all_text = "\n".join([page.get_text() for page in doc])
-        all_materials = extract_all_materials(all_text)
+    if not circle_codes:
+        messagebox.showerror("Error", "Please enter valid circle codes!")
+        return
 
-        # Extract all circle code/material pairs
+    def _worker():
+        # Extract all circle code/material pairs, then only keep results with
+        # a circle code matching the entered codes (case-insensitive)
         all_results, all_counts = extract_all_codes_from_pdf(pdf_path)
-        # Only keep results with a circle code and that match the entered circle codes (case-insensitive)
-        filtered_results = [
+        return [
             item for item in all_results
             if item['Circle Code'] and item['Circle Code'].upper() in circle_codes_upper
         ]
 
-        # Clear previous results
-        results_text.config(state=tk.NORMAL)
-        results_text.delete(1.0, tk.END)
+    def _show(filtered_results):
+        global _LAST_RESULTS
+        _LAST_RESULTS = filtered_results
+
+        # Build the whole report first and insert it once; per-row inserts
+        # make the Text widget re-index and redraw for every line
 
         # Show all materials count (filtered)
-        results_text.insert(tk.END, f"ALL MATERIALS WITH CIRCLE CODE COUNT: {len(filtered_results)}\n")
-        results_text.insert(tk.END, "-" * 50 + "\n")
-        for item in filtered_results:
-            results_text.insert(tk.END, f"{item['Circle Code']}: {item['Material Code']} (Page {item['Page']})\n")
-        results_text.insert(tk.END, "\n")
+        buf = [f"ALL MATERIALS WITH CIRCLE CODE COUNT: {len(filtered_results)}\n",
+               "-" * 50 + "\n"]
+        buf.extend(f"{item['Circle Code']}: {item['Material Code']} (Page {item['Page']})\n"
+                   for item in filtered_results)
+        buf.append("\n")
 
         # Show materials with circle codes (case-insensitive count, display as entered)
         if filtered_results:
-            results_text.insert(tk.END, "MATERIALS WITH CIRCLE CODES:\n")
-            results_text.insert(tk.END, "-" * 50 + "\n")
+            buf.append("MATERIALS WITH CIRCLE CODES:\n")
+            buf.append("-" * 50 + "\n")
+            # One pass over the results instead of one per entered code
+            by_code = Counter(item['Circle Code'].upper() for item in filtered_results)
             for code, code_upper in zip(circle_codes, circle_codes_upper):
-                count = sum(1 for item in filtered_results if item['Circle Code'].upper() == code_upper)
-                results_text.insert(tk.END, f"{code}: {count} materials found\n")
-            results_text.insert(tk.END, "\n" + "=" * 50 + "\n")
-            results_text.insert(tk.END, f"TOTAL MATERIALS WITH CIRCLE CODES: {len(filtered_results)}\n")
+                buf.append(f"{code}: {by_code.get(code_upper, 0)} materials found\n")
+            buf.append("\n" + "=" * 50 + "\n")
+            buf.append(f"TOTAL MATERIALS WITH CIRCLE CODES: {len(filtered_results)}\n")
             save_button.grid(row=5, column=1, pady=10)
         else:
-            results_text.insert(tk.END, f"No materials found for the specified circle codes: {', '.join(circle_codes)}")
+            buf.append(f"No materials found for the specified circle codes: {', '.join(circle_codes)}")
 
+        results_text.config(state=tk.NORMAL)
+        results_text.delete(1.0, tk.END)
+        results_text.insert(tk.END, "".join(buf))
         results_text.config(state=tk.DISABLED)
 
-    except Exception as e:
-        logging.error(f"Processing error: {str(e)}")
-        messagebox.showerror("Error", f"An error occurred: {str(e)}")
+    _run_in_background(_worker, _show)
+
+# Memoized extractions keyed by (path, mtime), so clicking more than one
+# button on the same file only pays for the extraction once
+_EXTRACT_CACHE = {}
+
+# Structured results behind the current display, used by save_results so the
+# export never has to reparse the text widget
+_LAST_RESULTS = []
+
 
 def extract_all_codes_from_pdf(pdf_path):
     """Extract all circle codes and their material codes from the PDF"""
+    try:
+        cache_key = (pdf_path, os.path.getmtime(pdf_path))
+    except OSError:
+        cache_key = None
+    if cache_key is not None and cache_key in _EXTRACT_CACHE:
+        cached_results, cached_counts = _EXTRACT_CACHE[cache_key]
+        return list(cached_results), cached_counts.copy()
+
     try:
         doc = fitz.open(pdf_path)
         results = []
-        code_counts = defaultdict(int)
-
-        # First pass: collect all circle codes
-        all_text = "\n".join([page.get_text() for page in doc])
-        circle_codes = set(re.findall(r'\b([A-Za-z0-9]{1,5})\b', all_text, re.IGNORECASE))
-        circle_codes = {code.upper() for code in circle_codes
-                       if re.match(r'^[A-Za-z0-9]{1,5}$', code, re.IGNORECASE) and code != '0'}
-
-        if not circle_codes:
-            logging.info("No circle codes found in document")
-            return [], defaultdict(int)
+        code_counts = Counter()
 
-        # Second pass: extract materials with page numbers
+        # Extract materials with page numbers
         for page_num, page in enumerate(doc, 1):
             text = page.get_text()
             # Pass empty set to extract_all_codes to get all materials
             page_results, page_counts = extract_all_codes(text, set(), str(page_num))
             results.extend(page_results)
-            for code, count in page_counts.items():
-                code_counts[code] += count
+            code_counts.update(page_counts)
 
         if results:
+            if cache_key is not None:
+                _EXTRACT_CACHE[cache_key] = (list(results), code_counts.copy())
             return results, code_counts
 
     except Exception as e:
         logging.warning(f"Native PDF extraction failed: {str(e)}")
 
     # OCR fallback
-    pages = convert_from_path(pdf_path, dpi=500, poppler_path=POPPLER_PATH)
-
     results = []
-    code_counts = defaultdict(int)
+    code_counts = Counter()
 
-    for page_num, page_img in enumerate(pages, 1):
-        text = pytesseract.image_to_string(page_img, config='--oem 3 --psm 6')
+    for page_num, text in _ocr_pages(pdf_path, dpi=300):
         text = clean_ocr_text(text)
         # Pass empty set to extract_all_codes to get all materials
         page_results, page_counts = extract_all_codes(text, set(), str(page_num))
         results.extend(page_results)
-        for code, count in page_counts.items():
-            code_counts[code] += count
+        code_counts.update(page_counts)
 
+    if cache_key is not None:
+        _EXTRACT_CACHE[cache_key] = (list(results), code_counts.copy())
     return results, code_counts
 
 
@@ -397,28 +555,34 @@ def process_all_materials():
         messagebox.showerror("Error", "Please select a PDF file first!")
         return
 
-    try:
+    def _worker():
         results, counts = extract_all_codes_from_pdf(pdf_path)
+        return results
 
-        # Clear previous results
-        results_text.config(state=tk.NORMAL)
-        results_text.delete(1.0, tk.END)
+    def _show(results):
+        global _LAST_RESULTS
+        _LAST_RESULTS = results
 
         if results:
-            results_text.insert(tk.END, "ALL MATERIALS (WITH OR WITHOUT CIRCLE CODES):\n\n")
-            results_text.insert(tk.END, "-" * 50 + "\n")
-            for item in results:
-                code_display = f"{item['Circle Code']}: " if item['Circle Code'] else ""
-                results_text.insert(tk.END, f"{code_display}{item['Material Code']} (Page {item['Page']})\n")
-            results_text.insert(tk.END, "\n" + "=" * 50 + "\n")
-            results_text.insert(tk.END, f"TOTAL MATERIALS FOUND: {len(results)}\n")
+            buf = ["ALL MATERIALS (WITH OR WITHOUT CIRCLE CODES):\n\n",
+                   "-" * 50 + "\n"]
+            buf.extend(
+                (f"{item['Circle Code']}: " if item['Circle Code'] else "")
+                + f"{item['Material Code']} (Page {item['Page']})\n"
+                for item in results
+            )
+            buf.append("\n" + "=" * 50 + "\n")
+            buf.append(f"TOTAL MATERIALS FOUND: {len(results)}\n")
             save_button.grid(row=5, column=1, pady=10)
         else:
-            results_text.insert(tk.END, "No materials found")
+            buf = ["No materials found"]
+
+        results_text.config(state=tk.NORMAL)
+        results_text.delete(1.0, tk.END)
+        results_text.insert(tk.END, "".join(buf))
         results_text.config(state=tk.DISABLED)
-    except Exception as e:
-        logging.error(f"Processing error: {str(e)}")
-        messagebox.showerror("Error", f"An error occurred: {str(e)}")
+
+    _run_in_background(_worker, _show)
 
 # Update process_all_codes to only show materials with a circle code
 def process_all_codes():
@@ -429,46 +593,43 @@ def process_all_codes():
         messagebox.showerror("Error", "Please select a PDF file first!")
         return
 
-    try:
+    def _worker():
         results, counts = extract_all_codes_from_pdf(pdf_path)
         # Filter to only those with a circle code
-        filtered_results = [item for item in results if item['Circle Code']]
-        filtered_counts = defaultdict(int)
-        for item in filtered_results:
-            filtered_counts[item['Circle Code']] += 1
+        return [item for item in results if item['Circle Code']]
 
-        # Clear previous results
-        results_text.config(state=tk.NORMAL)
-        results_text.delete(1.0, tk.END)
+    def _show(filtered_results):
+        global _LAST_RESULTS
+        _LAST_RESULTS = filtered_results
+        filtered_counts = Counter(item['Circle Code'] for item in filtered_results)
 
         if filtered_results:
-            results_text.insert(tk.END, "ALL CIRCLE CODES AND MATERIALS FOUND (ONLY WITH CIRCLE CODE):\n\n")
-            results_text.insert(tk.END, "MATERIAL CODE COUNTS:\n")
-            results_text.insert(tk.END, "-" * 50 + "\n")
-            for code, count in filtered_counts.items():
-                results_text.insert(tk.END, f"{code}: {count} materials found\n")
-            results_text.insert(tk.END, "\nALL MATERIAL CODES:\n")
-            results_text.insert(tk.END, "-" * 50 + "\n")
-            for item in filtered_results:
-                results_text.insert(tk.END, f"{item['Circle Code']}: {item['Material Code']} (Page {item['Page']})\n")
-            results_text.insert(tk.END, "\n" + "=" * 50 + "\n")
-            results_text.insert(tk.END, f"TOTAL MATERIALS FOUND: {len(filtered_results)}\n")
+            buf = ["ALL CIRCLE CODES AND MATERIALS FOUND (ONLY WITH CIRCLE CODE):\n\n",
+                   "MATERIAL CODE COUNTS:\n",
+                   "-" * 50 + "\n"]
+            buf.extend(f"{code}: {count} materials found\n"
+                       for code, count in filtered_counts.items())
+            buf.append("\nALL MATERIAL CODES:\n")
+            buf.append("-" * 50 + "\n")
+            buf.extend(f"{item['Circle Code']}: {item['Material Code']} (Page {item['Page']})\n"
+                       for item in filtered_results)
+            buf.append("\n" + "=" * 50 + "\n")
+            buf.append(f"TOTAL MATERIALS FOUND: {len(filtered_results)}\n")
             save_button.grid(row=5, column=1, pady=10)
         else:
-            results_text.insert(tk.END, "No circle codes and materials found")
+            buf = ["No circle codes and materials found"]
+
+        results_text.config(state=tk.NORMAL)
+        results_text.delete(1.0, tk.END)
+        results_text.insert(tk.END, "".join(buf))
         results_text.config(state=tk.DISABLED)
-    except Exception as e:
-        logging.error(f"Processing error: {str(e)}")
-        messagebox.showerror("Error", f"An error occurred: {str(e)}")
 
+    _run_in_background(_worker, _show)
 
-def save_results():
-    """Save the current results to Excel, exporting all columns present in the current output (with or without circle code)"""
-    # Get the text from results_text widget
-    content = results_text.get(1.0, tk.END)
 
-    # Check if we have results to save
-    if "TOTAL MATERIALS FOUND: 0" in content or "No circle codes" in content or "No materials found" in content:
+def save_results():
+    """Save the current results to Excel, straight from the structured data behind the display"""
+    if not _LAST_RESULTS:
         messagebox.showwarning("No Results", "There are no results to save")
         return
 
@@ -479,122 +640,91 @@ def save_results():
     )
 
     if save_path:
-        # Parse the results from the text widget
-        lines = content.split('\n')
-        results = []
-        for line in lines:
-            # Try to match lines like: CODE: MATERIAL (Page X)
-            if ": " in line and "Page" in line:
-                parts = line.split(': ', 1)
-                circle_code = parts[0].strip()
-                rest = parts[1].split('(Page ')
-                material_code = rest[0].strip()
-                page = rest[1].replace(')', '').strip() if len(rest) > 1 else ''
-                # If circle_code is empty or just a dash, treat as blank
-                if circle_code == '' or circle_code == '-':
-                    circle_code = ''
-                results.append({
-                    "Circle Code": circle_code,
-                    "Material Code": material_code,
-                    "Page": page
-                })
-            # Or lines like: MATERIAL (Page X) (no circle code)
-            elif "(Page" in line and ":" not in line:
-                material_code = line.split('(Page')[0].strip()
-                page = line.split('(Page')[1].replace(')', '').strip() if '(Page' in line else ''
-                results.append({
-                    "Circle Code": '',
-                    "Material Code": material_code,
-                    "Page": page
-                })
-        if results:
-            # Dynamically determine columns
-            import pandas as pd
-            df = pd.DataFrame(results)
-            # Only keep columns that are present in the data
-            columns = [col for col in ["Circle Code", "Material Code", "Page"] if col in df.columns]
-            df = df[columns]
-            df.to_excel(save_path, index=False)
+        if save_to_excel(_LAST_RESULTS, save_path):
             messagebox.showinfo("Saved", f"Results saved to {save_path}")
         else:
-            messagebox.showwarning("No Results", "Could not parse results for saving")
-
-
-# === GUI Setup ===
-root = tk.Tk()
-root.title("PDF Material Extractor")
-root.geometry("1000x600")
-root.configure(bg="#f4f4f4")
-
-# Style
-style = ttk.Style()
-style.theme_use('clam')
-style.configure('TLabel', font=('Segoe UI', 11), background="#f4f4f4")
-style.configure('TButton', font=('Segoe UI', 11), padding=3, background="lightblue")
-style.configure('TEntry', font=('Segoe UI', 11))
-style.configure('TFrame', background="#f4f4f4")
-style.configure('TLabelframe', background="#f4f4f4", font=('Segoe UI', 12, 'bold'))
-
-# Main frame
-main_frame = ttk.Frame(root, padding="20 15 20 15")
-main_frame.grid(row=0, column=0, sticky="nsew")
-root.grid_rowconfigure(0, weight=1)
-root.grid_columnconfigure(0, weight=1)
-
-# Configure grid weights for resizing
-root.grid_rowconfigure(4, weight=1)
-root.grid_columnconfigure(1, weight=1)
-
-# PDF Selection
-pdf_frame = ttk.LabelFrame(main_frame, text="PDF Selection", padding="10 10 10 10")
-pdf_frame.grid(row=0, column=0, sticky="ew", pady=10)
-pdf_frame.grid_columnconfigure(1, weight=1)
-ttk.Label(pdf_frame, text="Select PDF File:").grid(row=0, column=0, padx=5, pady=5, sticky='e')
-pdf_entry = ttk.Entry(pdf_frame, width=60)
-pdf_entry.grid(row=0, column=1, padx=5, pady=5, sticky='ew')
-ttk.Button(pdf_frame, text="Browse", command=browse_pdf).grid(row=0, column=2, padx=5, pady=5)
-
-
-# Circle Codes Input
-circle_frame = ttk.LabelFrame(main_frame, text="Circle Codes", padding="10 10 10 10")
-circle_frame.grid(row=1, column=0, sticky="ew", pady=10)
-circle_frame.grid_columnconfigure(1, weight=1)
-ttk.Label(circle_frame, text="Enter Circle Codes (comma separated):").grid(row=0, column=0, padx=5, pady=5, sticky='e')
-circle_entry = ttk.Entry(circle_frame, width=60)
-circle_entry.grid(row=0, column=1, padx=5, pady=5, sticky='ew')
-
-# Process Buttons
-button_frame = ttk.Frame(main_frame)
-button_frame.grid(row=2, column=0, pady=10, sticky="ew")
-button_frame.grid_columnconfigure((0, 1, 2), weight=1)
-
-# Extract buttons
-extract_material_btn = ttk.Button(button_frame, text="Extract Material Codes", command=process_pdf)
-extract_material_btn.grid(row=0, column=0, padx=5, ipadx=5, ipady=3, sticky="ew")
-extract_all_codes_btn = ttk.Button(button_frame, text="Extract All Circle Codes", command=process_all_codes)
-extract_all_codes_btn.grid(row=0, column=1, padx=5, ipadx=5, ipady=3, sticky="ew")
-extract_all_materials_btn = ttk.Button(button_frame, text="Extract All Materials", command=process_all_materials)
-extract_all_materials_btn.grid(row=0, column=2, padx=5, ipadx=5, ipady=3, sticky="ew")
-
-
-# Results Text Area with Scrollbar
-results_frame = ttk.LabelFrame(main_frame, text="Results", padding="10 10 10 10")
-results_frame.grid(row=3, column=0, padx=10, pady=5, sticky='ew')
-results_frame.grid_rowconfigure(0, weight=1)
-results_frame.grid_columnconfigure(0, weight=1)
-
-results_text = tk.Text(results_frame, wrap=tk.WORD, font=('Consolas', 11), bg="#f9f9f9", relief=tk.FLAT, borderwidth=2)
-results_text.grid(row=0, column=0, sticky="nsew")
-scrollbar = ttk.Scrollbar(results_frame, command=results_text.yview)
-scrollbar.grid(row=0, column=1, sticky='ns')
-results_text['yscrollcommand'] = scrollbar.set
-
-# Save Button (initially hidden)
-save_button = ttk.Button(main_frame, text="Save Results to Excel", command=save_results)
-save_button.grid(row=4, column=0, pady=(5,15), sticky='w', padx=10)
-save_button.grid_remove()
-
-main_frame.grid_rowconfigure(3, weight=1)
-main_frame.grid_columnconfigure(0, weight=1)
-
-root.mainloop()
\ No newline at end of file
+            messagebox.showwarning("No Results", "Could not save results")
+
+
+if __name__ == "__main__":
+    # === GUI Setup ===
+    root = tk.Tk()
+    root.title("PDF Material Extractor")
+    root.geometry("1000x600")
+    root.configure(bg="#f4f4f4")
+
+    # Style
+    style = ttk.Style()
+    style.theme_use('clam')
+    style.configure('TLabel', font=('Segoe UI', 11), background="#f4f4f4")
+    style.configure('TButton', font=('Segoe UI', 11), padding=3, background="lightblue")
+    style.configure('TEntry', font=('Segoe UI', 11))
+    style.configure('TFrame', background="#f4f4f4")
+    style.configure('TLabelframe', background="#f4f4f4", font=('Segoe UI', 12, 'bold'))
+
+    # Main frame
+    main_frame = ttk.Frame(root, padding="20 15 20 15")
+    main_frame.grid(row=0, column=0, sticky="nsew")
+    root.grid_rowconfigure(0, weight=1)
+    root.grid_columnconfigure(0, weight=1)
+
+    # Configure grid weights for resizing
+    root.grid_rowconfigure(4, weight=1)
+    root.grid_columnconfigure(1, weight=1)
+
+    # PDF Selection
+    pdf_frame = ttk.LabelFrame(main_frame, text="PDF Selection", padding="10 10 10 10")
+    pdf_frame.grid(row=0, column=0, sticky="ew", pady=10)
+    pdf_frame.grid_columnconfigure(1, weight=1)
+    ttk.Label(pdf_frame, text="Select PDF File:").grid(row=0, column=0, padx=5, pady=5, sticky='e')
+    pdf_entry = ttk.Entry(pdf_frame, width=60)
+    pdf_entry.grid(row=0, column=1, padx=5, pady=5, sticky='ew')
+    ttk.Button(pdf_frame, text="Browse", command=browse_pdf).grid(row=0, column=2, padx=5, pady=5)
+
+
+    # Circle Codes Input
+    circle_frame = ttk.LabelFrame(main_frame, text="Circle Codes", padding="10 10 10 10")
+    circle_frame.grid(row=1, column=0, sticky="ew", pady=10)
+    circle_frame.grid_columnconfigure(1, weight=1)
+    ttk.Label(circle_frame, text="Enter Circle Codes (comma separated):").grid(row=0, column=0, padx=5, pady=5, sticky='e')
+    circle_entry = ttk.Entry(circle_frame, width=60)
+    circle_entry.grid(row=0, column=1, padx=5, pady=5, sticky='ew')
+
+    # Process Buttons
+    button_frame = ttk.Frame(main_frame)
+    button_frame.grid(row=2, column=0, pady=10, sticky="ew")
+    button_frame.grid_columnconfigure((0, 1, 2), weight=1)
+
+    # Extract buttons
+    extract_material_btn = ttk.Button(button_frame, text="Extract Material Codes", command=process_pdf)
+    extract_material_btn.grid(row=0, column=0, padx=5, ipadx=5, ipady=3, sticky="ew")
+    extract_all_codes_btn = ttk.Button(button_frame, text="Extract All Circle Codes", command=process_all_codes)
+    extract_all_codes_btn.grid(row=0, column=1, padx=5, ipadx=5, ipady=3, sticky="ew")
+    extract_all_materials_btn = ttk.Button(button_frame, text="Extract All Materials", command=process_all_materials)
+    extract_all_materials_btn.grid(row=0, column=2, padx=5, ipadx=5, ipady=3, sticky="ew")
+
+    # Disabled while a background extraction runs
+    _process_buttons.extend([extract_material_btn, extract_all_codes_btn, extract_all_materials_btn])
+
+
+    # Results Text Area with Scrollbar
+    results_frame = ttk.LabelFrame(main_frame, text="Results", padding="10 10 10 10")
+    results_frame.grid(row=3, column=0, padx=10, pady=5, sticky='ew')
+    results_frame.grid_rowconfigure(0, weight=1)
+    results_frame.grid_columnconfigure(0, weight=1)
+
+    results_text = tk.Text(results_frame, wrap=tk.WORD, font=('Consolas', 11), bg="#f9f9f9", relief=tk.FLAT, borderwidth=2)
+    results_text.grid(row=0, column=0, sticky="nsew")
+    scrollbar = ttk.Scrollbar(results_frame, command=results_text.yview)
+    scrollbar.grid(row=0, column=1, sticky='ns')
+    results_text['yscrollcommand'] = scrollbar.set
+
+    # Save Button (initially hidden)
+    save_button = ttk.Button(main_frame, text="Save Results to Excel", command=save_results)
+    save_button.grid(row=4, column=0, pady=(5,15), sticky='w', padx=10)
+    save_button.grid_remove()
+
+    main_frame.grid_rowconfigure(3, weight=1)
+    main_frame.grid_columnconfigure(0, weight=1)
+
+    root.mainloop()
\ No newline at end of file